@@ -1,22 +1,59 @@
 from flask import Flask, render_template, request, g
+from functools import lru_cache
 import sqlite3
-import re
+import queue
+import random
+import jieba
+import jieba.posseg as pseg
 
 app = Flask(__name__)
+# Load jieba's dictionary at startup instead of on the first /analyze request
+jieba.initialize()
 DATABASE = 'resources/dictionary.db'
+# Translation tables for normalizing pinyin queries
+STRIP_SPACES = str.maketrans('', '', ' ')
+STRIP_SPACES_DIGITS = str.maketrans('', '', ' 0123456789')
+# Makes GLOB match these characters literally
+GLOB_ESCAPES = str.maketrans({'*': '[*]', '?': '[?]', '[': '[[]'})
+# Longest word convert.py records in the sentence_words table
+EXAMPLE_WORD_MAX_LENGTH = 4
+# Sentence ids fetched per word to pick the random examples from
+EXAMPLE_CANDIDATES = 50
+
+# Idle connections are kept here and reused by later requests, so each request
+# skips opening the file and keeps SQLite's page and statement caches warm
+DB_POOL_SIZE = 8
+_db_pool = queue.Queue(maxsize=DB_POOL_SIZE)
+
+def connect_db():
+    # A pooled connection can be handed to a different request thread;
+    # the pool guarantees only one thread uses it at a time
+    db = sqlite3.connect(DATABASE, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute('PRAGMA cache_size = -65536')
+    db.execute('PRAGMA mmap_size = 268435456')
+    db.execute('PRAGMA temp_store = MEMORY')
+    return db
 
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        try:
+            db = _db_pool.get_nowait()
+        except queue.Empty:
+            db = connect_db()
+        g._database = db
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        try:
+            _db_pool.put_nowait(db)
+        except queue.Full:
+            db.close()
 
 def query_db(query, args=(), one=False):
     cur = get_db().execute(query, args)
@@ -30,187 +67,185 @@ def index():
 
 def get_example_sentences(characters, limit=5):
     """Get example sentences containing the given characters."""
-    sql = '''SELECT chinese, english FROM sentences 
-             WHERE chinese LIKE ? 
-             ORDER BY RANDOM() 
-             LIMIT ?'''
-    return query_db(sql, [f"%{characters}%", limit])
+    if len(characters) <= EXAMPLE_WORD_MAX_LENGTH:
+        # Words are pre-matched against sentences by convert.py; read a window of
+        # candidates at a random offset so common words stay cheap
+        count = query_db('SELECT COUNT(*) AS n FROM sentence_words WHERE word = ?', [characters], one=True)['n']
+        offset = random.randrange(max(count - EXAMPLE_CANDIDATES, 0) + 1)
+        rows = query_db('SELECT sentence_id AS id FROM sentence_words WHERE word = ? LIMIT ? OFFSET ?',
+                        [characters, EXAMPLE_CANDIDATES, offset])
+    else:
+        rows = query_db('SELECT id FROM sentences WHERE chinese LIKE ? LIMIT ?', [f"%{characters}%", EXAMPLE_CANDIDATES])
+    if not rows:
+        return []
+
+    # Pick the random sample here rather than sorting every match with ORDER BY RANDOM()
+    ids = random.sample([row['id'] for row in rows], min(limit, len(rows)))
+    placeholders = ','.join('?' * len(ids))
+    return query_db(f'SELECT chinese, english FROM sentences WHERE id IN ({placeholders})', ids)
 
 
 @app.route('/about')
 def about():
     return render_template('about.html')
 
+# Search SQL is kept as constants so every request executes identical statement
+# text, which lets SQLite's statement cache reuse the compiled programs
+
+# Only the columns the merge and the results page read
+SEARCH_COLUMNS = ['id', 'traditional', 'simplified', 'pinyin', 'pinyin_marks', 'definitions',
+                  'has_examples', 'has_stroke', 'hsk_level']
+
+# match_type values, in priority order (lower = better):
+# 0 = exact, 1 = starts with, 2 = English FTS
+
+# Hanzi/pinyin lookup: every exact match also starts with the query, so one
+# scan finds both kinds and labels them. GLOB is case-sensitive, so unlike
+# LIKE its prefix patterns are range scans on the plain column indexes
+LOOKUP_SQL = f'''
+    SELECT {', '.join(SEARCH_COLUMNS)},
+           CASE WHEN traditional = ? OR simplified = ? OR {{pinyin}} = ? THEN 0 ELSE 1 END AS match_type,
+           0 AS fts_rank
+    FROM dictionary
+    WHERE traditional GLOB ? OR simplified GLOB ? OR {{pinyin}} GLOB ?
+'''
+# English full-text search, keeping only the best-ranked matches; far more
+# than anyone pages through, and it bounds the rows merged for common words
+FTS_RESULT_LIMIT = 500
+FTS_SQL = f'''
+    SELECT {', '.join('d.' + column for column in SEARCH_COLUMNS)}, 2 AS match_type, f.rank AS fts_rank
+    FROM (
+        SELECT rowid, rank FROM dictionary_fts
+        WHERE dictionary_fts MATCH ?
+        ORDER BY rank
+        LIMIT {FTS_RESULT_LIMIT}
+    ) f
+    JOIN dictionary d ON d.id = f.rowid
+'''
+# Merge candidates sharing (simplified, pinyin) and rank the merged entries,
+# so no per-row scoring is left to Python.
+# Traditional variants and definitions are concatenated here and deduplicated
+# in Python. Pinyin is grouped on the raw column, which is ASCII, so LOWER()
+# folds it completely.
+MERGE_SQL = '''
+    WITH candidates AS ({candidates})
+    SELECT MIN(id) AS id,
+           simplified,
+           MIN(pinyin_marks) AS pinyin_marks,
+           GROUP_CONCAT(traditional, char(31)) AS traditional,
+           GROUP_CONCAT(definitions, '/') AS definitions,
+           MAX(has_examples) AS has_examples,
+           MAX(has_stroke) AS has_stroke,
+           COALESCE(MIN(NULLIF(hsk_level, 0)), 0) AS hsk_level,
+           MIN(match_type) AS match_type,
+           CASE WHEN MIN(match_type) = 2 THEN MIN(fts_rank) ELSE 0 END AS fts_rank,
+           COUNT(*) OVER () AS total_results
+    FROM candidates
+    GROUP BY simplified, LOWER(pinyin)
+    ORDER BY
+        -- Priority (lower = better)
+        MIN(match_type),
+        -- Big bonus if the query exactly matches one of the definitions (split by /)
+        CASE WHEN MIN(match_type) = 2 AND MAX(instr('/' || lower(definitions) || '/', ?)) > 0 THEN -10 ELSE 0 END,
+        -- HSK levels 1-7 (7 is 7-9). If not in HSK, give level 10 as penalty
+        COALESCE(MIN(NULLIF(hsk_level, 0)), 10),
+        -- Data quality (no stroke data is a big penalty)
+        (2 - 2 * MAX(has_examples)) + (5 - 5 * MAX(has_stroke)),
+        -- FTS rank (for English searches)
+        CASE WHEN MIN(match_type) = 2 THEN MIN(fts_rank) ELSE 0 END,
+        -- Length (shorter = better, prefer common words)
+        length(simplified),
+        MIN(id)
+    -- Only one page is returned, so SQLite keeps just the top rows while sorting
+    LIMIT ? OFFSET ?
+'''
+
+SEARCH_SQL = MERGE_SQL.format(candidates=f"{LOOKUP_SQL.format(pinyin='pinyin_clean')} UNION ALL {FTS_SQL}")
+SEARCH_TONES_SQL = MERGE_SQL.format(candidates=f"{LOOKUP_SQL.format(pinyin='pinyin_numbered')} UNION ALL {FTS_SQL}")
+# Fallbacks without the FTS part, for queries FTS5 cannot parse
+LOOKUP_ONLY_SQL = MERGE_SQL.format(candidates=LOOKUP_SQL.format(pinyin='pinyin_clean'))
+LOOKUP_ONLY_TONES_SQL = MERGE_SQL.format(candidates=LOOKUP_SQL.format(pinyin='pinyin_numbered'))
+CHAR_BREAKDOWN_SQL = 'SELECT simplified, traditional, pinyin_marks, definitions FROM dictionary WHERE simplified IN ({placeholders}) AND length(simplified) = 1 ORDER BY id'
+
+RESULTS_PER_PAGE = 20
+SQLITE_MAX_INTEGER = 2**63 - 1
+
 @app.route('/search')
 def search():
     query = request.args.get('q', '').strip()
     page = request.args.get('page', 1, type=int)
-    RESULTS_PER_PAGE = 20
     
     if not query:
         return render_template('index.html')
     
+    return render_template('results.html', 
+                         query=query,
+                         page=page,
+                         results_per_page=RESULTS_PER_PAGE,
+                         **search_dictionary(query, page))
+
+@lru_cache(maxsize=4096)
+def search_dictionary(query, page):
+    """Search the dictionary and build one page of results.
+
+    The dictionary is read-only while the app runs, so results are cached
+    for the lifetime of the process.
+    """
     # Check if query has digits (tone numbers)
     has_tones = any(char.isdigit() for char in query)
     
     # Normalize query
-    clean_query = query.lower().replace(' ', '')
-    clean_pinyin_no_tones = re.sub(r'[0-9]', '', clean_query)
-    
-    db = get_db()
+    pinyin_query = query.lower().translate(STRIP_SPACES if has_tones else STRIP_SPACES_DIGITS)
     
-    all_results = []
-    seen_ids = set()
-
-    def add_unique_results(new_rows, match_type='other'):
-        for row in new_rows:
-            if row['id'] not in seen_ids:
-                result = dict(row)
-                result['_match_type'] = match_type  # For scoring
-                all_results.append(result)
-                seen_ids.add(row['id'])
+    # Pagination
+    offset = (page - 1) * RESULTS_PER_PAGE
+    # Pages past SQLite's integer range cannot be bound, and would be empty anyway
+    if page < 1 or offset > SQLITE_MAX_INTEGER:
+        return {'results': [], 'total_pages': 0, 'total_results': 0}
+    page_args = [RESULTS_PER_PAGE, offset]
 
-    # 1. Exact matches (highest priority)
-    if has_tones:
-        exact_sql = '''
-            SELECT *, 1 as has_examples, 1 as has_stroke FROM dictionary 
-            WHERE traditional = ? OR simplified = ? OR pinyin_numbered = ?
-        '''
-        # Note: selecting *, columns will be overridden by the actual values in the table if they exist
-        # Since I added them to the table, I should just select *
-        exact_sql = 'SELECT * FROM dictionary WHERE traditional = ? OR simplified = ? OR pinyin_numbered = ?'
-        exact_rows = query_db(exact_sql, [query, query, clean_query])
-    else:
-        exact_sql = 'SELECT * FROM dictionary WHERE traditional = ? OR simplified = ? OR pinyin_clean = ?'
-        exact_rows = query_db(exact_sql, [query, query, clean_pinyin_no_tones])
-    add_unique_results(exact_rows, 'exact')
-    
-    # 2. Starts with
-    if has_tones:
-        start_sql = 'SELECT * FROM dictionary WHERE (traditional LIKE ? OR simplified LIKE ? OR pinyin_numbered LIKE ?)'
-        like_query = f"{query}%"
-        like_pinyin = f"{clean_query}%"
-        start_rows = query_db(start_sql, [like_query, like_query, like_pinyin])
-    else:
-        start_sql = 'SELECT * FROM dictionary WHERE (traditional LIKE ? OR simplified LIKE ? OR pinyin_clean LIKE ?)'
-        like_query = f"{query}%"
-        like_pinyin = f"{clean_pinyin_no_tones}%"
-        start_rows = query_db(start_sql, [like_query, like_query, like_pinyin])
-    add_unique_results(start_rows, 'starts_with')
-    
-    # 3. English FTS
-    fts_sql = '''
-        SELECT d.*, f.rank as fts_rank
-        FROM dictionary d
-        JOIN dictionary_fts f ON d.id = f.rowid
-        WHERE dictionary_fts MATCH ? 
-        ORDER BY rank 
-    '''
-    fts_query = f'"{query}"'
+    # Exact and starts-with matches on hanzi/pinyin, plus English FTS matches
+    glob_query = query.translate(GLOB_ESCAPES) + '*'
+    glob_pinyin = pinyin_query.translate(GLOB_ESCAPES) + '*'
+    lookup_args = [query, query, pinyin_query, glob_query, glob_query, glob_pinyin]
+    fts_query = '"' + query.replace('"', '""') + '"'
+    definition_query = f"/{query.lower()}/"
     try:
-        fts_rows = query_db(fts_sql, [fts_query])
-        add_unique_results(fts_rows, 'fts')
-    except Exception as e:
+        rows = query_db(SEARCH_TONES_SQL if has_tones else SEARCH_SQL, lookup_args + [fts_query, definition_query] + page_args)
+    except sqlite3.OperationalError as e:
         print(f"FTS Error: {e}")
-    
-    # Merging logic
-    merged_results = {}
-    for result in all_results:
-        # Group by (simplified, pinyin_marks) case-insensitive
-        key = (result['simplified'], result['pinyin_marks'].lower())
-        
-        if key not in merged_results:
-            merged_results[key] = result
-            # Ensure these are lists/sets for combining
-            merged_results[key]['traditional_variants'] = {result['traditional']}
-            merged_results[key]['definition_list'] = result['definitions'].split('/')
-        else:
-            existing = merged_results[key]
-            # Merge traditional variants
-            existing['traditional_variants'].add(result['traditional'])
-            
-            # Merge definitions
-            new_defs = result['definitions'].split('/')
-            for d in new_defs:
-                if d and d not in existing['definition_list']:
-                    existing['definition_list'].append(d)
-            
-            # Update data flags (OR logic)
-            existing['has_examples'] = existing.get('has_examples', 0) or result.get('has_examples', 0)
-            existing['has_stroke'] = existing.get('has_stroke', 0) or result.get('has_stroke', 0)
-            
-            # Update HSK level (take the lower/easier one if both exist)
-            l1 = existing.get('hsk_level', 0)
-            l2 = result.get('hsk_level', 0)
-            if l1 == 0: existing['hsk_level'] = l2
-            elif l2 != 0: existing['hsk_level'] = min(l1, l2)
-            
-            # Use the higher priority match type
-            priority_map = {'exact': 0, 'starts_with': 1, 'fts': 2, 'other': 3}
-            if priority_map[result.get('_match_type', 'other')] < priority_map[existing.get('_match_type', 'other')]:
-                existing['_match_type'] = result['_match_type']
-                # If the better match type has a rank, use it
-                if 'fts_rank' in result:
-                    existing['fts_rank'] = result['fts_rank']
+        rows = query_db(LOOKUP_ONLY_TONES_SQL if has_tones else LOOKUP_ONLY_SQL, lookup_args + [definition_query] + page_args)
 
-    # Convert back to list and finalize merged fields
-    all_results = []
-    for entry in merged_results.values():
+    # Finalize merged fields
+    paginated_results = []
+    for row in rows:
+        entry = dict(row)
         # Join traditional variants back into a string
-        entry['traditional'] = " / ".join(sorted(list(entry['traditional_variants'])))
-        # Join definitions back into the canonical format
-        entry['definitions'] = "/".join(entry['definition_list'])
-        all_results.append(entry)
+        entry['traditional'] = " / ".join(sorted(set(row['traditional'].split('\x1f'))))
+        # Join definitions back into the canonical format, dropping duplicates
+        entry['definitions'] = "/".join(dict.fromkeys(d for d in row['definitions'].split('/') if d))
+        paginated_results.append(entry)
 
-    # Score and sort results
-    def score_result(result):
-        match_type = result.get('_match_type', 'other')
-        
-        # Priority (lower = better)
-        priority_map = {
-            'exact': 0,
-            'starts_with': 1,
-            'fts': 2,
-            'other': 3
-        }
-        priority = priority_map.get(match_type, 3)
-        
-        # Data Quality Bonus (lower = better)
-        data_score = 0
-        if not result.get('has_examples'): data_score += 2
-        if not result.get('has_stroke'): data_score += 5 # No stroke data is a big penalty
-        
-        # HSK Score (lower = better)
-        # HSK levels 1-7 (7 is 7-9). If not in HSK, give level 10 as penalty
-        hsk_level = result.get('hsk_level', 0)
-        hsk_score = hsk_level if hsk_level > 0 else 10
-        
-        # FTS Rank (for English searches)
-        fts_rank = result.get('fts_rank', 0)
-        
-        # Length (shorter = better, prefer common words)
-        length = len(result.get('simplified', ''))
-        
-        # Bonus if the query exactly matches one of the definitions (split by /)
-        exact_def_bonus = 0
-        if match_type == 'fts':
-            defs = result.get('definitions', '').lower().split('/')
-            if query.lower() in [d.strip() for d in defs]:
-                exact_def_bonus = -10 # Big bonus for exact definition match
-        
-        return (priority, exact_def_bonus, hsk_score, data_score, fts_rank, length)
-    
-    all_results.sort(key=score_result)
-    
-    # Pagination
-    total_results = len(all_results)
+    total_results = rows[0]['total_results'] if rows else 0
     total_pages = (total_results + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE  # Ceiling division
-    start_idx = (page - 1) * RESULTS_PER_PAGE
-    end_idx = start_idx + RESULTS_PER_PAGE
-    paginated_results = all_results[start_idx:end_idx]
     
-    # Get example sentences and character breakdown for each result
+    # Fetch every character needed for the breakdowns on this page in one query
+    chars = {char for result in paginated_results if len(result['simplified']) >= 2
+             for char in result['simplified']}
     char_cache = {}
+    if chars:
+        placeholders = ','.join('?' * len(chars))
+        char_rows = query_db(CHAR_BREAKDOWN_SQL.format(placeholders=placeholders), list(chars))
+        for char_data in char_rows:
+            # Keep the first entry for each character
+            if char_data['simplified'] not in char_cache:
+                char_info = dict(char_data)
+                # Truncate definitions for the table
+                short_defs = char_info['definitions'].split('/')
+                char_info['short_definitions'] = "/".join(short_defs[:3])
+                char_cache[char_data['simplified']] = char_info
+
+    # Get example sentences and character breakdown for each result
     for result in paginated_results:
         char_to_search = result['simplified']
         
@@ -224,46 +259,42 @@ def search():
             # We want to breakdown both simplified and traditional if they differ
             # But the breakdown is usually per character slot
             # So we iterate through the simplified characters
-            for i, char in enumerate(char_to_search):
+            for char in char_to_search:
                 if char in char_cache:
                     result['character_breakdown'].append(char_cache[char])
                 else:
-                    # Fetch definitions for this specific character
-                    # Prefer exact matches where it's just this character
-                    char_data = query_db('SELECT * FROM dictionary WHERE simplified = ? AND length(simplified) = 1 LIMIT 1', [char], one=True)
-                    if char_data:
-                        char_info = dict(char_data)
-                        # Truncate definitions for the table
-                        short_defs = char_info['definitions'].split('/')
-                        char_info['short_definitions'] = "/".join(short_defs[:3])
-                        char_cache[char] = char_info
-                        result['character_breakdown'].append(char_info)
-                    else:
-                        # Fallback for characters not found as single entries
-                        result['character_breakdown'].append({
-                            'simplified': char, 
-                            'traditional': char, 
-                            'pinyin_marks': '', 
-                            'definitions': 'N/A',
-                            'short_definitions': 'N/A'
-                        })
+                    # Fallback for characters not found as single entries
+                    result['character_breakdown'].append({
+                        'simplified': char, 
+                        'traditional': char, 
+                        'pinyin_marks': '', 
+                        'definitions': 'N/A',
+                        'short_definitions': 'N/A'
+                    })
 
         # Remove internal scoring field
-        result.pop('_match_type', None)
+        result.pop('match_type', None)
     
-    return render_template('results.html', 
-                         query=query,
-                         results=paginated_results,
-                         page=page,
-                         total_pages=total_pages,
-                         total_results=total_results,
-                         results_per_page=RESULTS_PER_PAGE)
+    return {
+        'results': paginated_results,
+        'total_pages': total_pages,
+        'total_results': total_results,
+    }
+
+ANALYZE_LOOKUP_CHUNK = 400
+ANALYZE_LOOKUP_SQL = '''
+    SELECT simplified, traditional, pinyin_marks, definitions, hsk_level FROM dictionary
+    WHERE simplified IN ({placeholders}) OR traditional IN ({placeholders})
+    ORDER BY id
+'''
+
+@lru_cache(maxsize=1024)
+def segment_text(text):
+    """Segment and POS tag text, returning a tuple of (word, flag) pairs."""
+    return tuple((pair.word, pair.flag) for pair in pseg.cut(text))
 
 @app.route('/analyze')
 def analyze():
-    import jieba
-    import jieba.posseg as pseg
-    
     # Check if 'text' parameter exists in the URL
     if 'text' in request.args:
         text = request.args.get('text', '').strip()
@@ -278,11 +309,26 @@ def analyze():
         return render_template('analyze.html', analyzed_segments=[])
     
     # Segment and POS tag
-    segments = pseg.cut(text)
+    segments = segment_text(text)
     
-    analyzed_segments = []
+    # Look up the distinct words in a few batched queries
+    words = list({word for word, _ in segments if word.strip()})
+    by_simplified = {}
+    by_traditional = {}
+    # Each word is bound twice, so chunks stay under SQLite's 999 variable limit
+    for i in range(0, len(words), ANALYZE_LOOKUP_CHUNK):
+        chunk = words[i:i + ANALYZE_LOOKUP_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        rows = query_db(ANALYZE_LOOKUP_SQL.format(placeholders=placeholders), chunk + chunk)
+        chunk_words = set(chunk)
+        for row in rows:
+            # Keep the first entry for each word of this chunk
+            if row['simplified'] in chunk_words:
+                by_simplified.setdefault(row['simplified'], row)
+            if row['traditional'] in chunk_words:
+                by_traditional.setdefault(row['traditional'], row)
     
-    db = get_db()
+    analyzed_segments = []
     
     for word, flag in segments:
         # Skip purely whitespace segments if you want, or keep them for formatting
@@ -294,9 +340,8 @@ def analyze():
             })
             continue
             
-        # Query dictionary for this word
-        # We try exact match first
-        row = query_db('SELECT * FROM dictionary WHERE simplified = ? OR traditional = ? LIMIT 1', [word, word], one=True)
+        # Prefer a simplified match over a traditional one
+        row = by_simplified.get(word) or by_traditional.get(word)
         
         segment_data = {
             'word': word,
@@ -1,87 +1,108 @@
 import sqlite3
 import re
+import string
+from functools import lru_cache
+from multiprocessing import Pool
 
-def decode_pinyin(s):
-    # s is like "ni3 hao3" or "nu:4"
-    # Mapping for tones
-    tone_marks = {
-        'a': 'āáǎàa',
-        'e': 'ēéěèe',
-        'i': 'īíǐìi',
-        'o': 'ōóǒòo',
-        'u': 'ūúǔùu',
-        'v': 'ǖǘǚǜü',
-        'ü': 'ǖǘǚǜü',
-    }
+try:
+    import ahocorasick
+except ImportError:
+    # Optional (pip install pyahocorasick); falls back to a pure Python scan
+    ahocorasick = None
+
+# Dictionary lines handed to each worker process at a time
+PARSE_CHUNK_SIZE = 2000
+
+# Pattern used by parse_line, compiled once rather than per dictionary line
+LINE_RE = re.compile(r'(\S+)\s+(\S+)\s+\[(.*?)\]\s+/(.*)/')
+# Any character in the CJK Unified Ideographs block (stroke data available)
+CJK_RE = re.compile('[\u4e00-\u9fff]')
+# Translation tables for stripping pinyin (CC-CEDICT pinyin is ASCII)
+STRIP_DIGITS_WS = str.maketrans('', '', string.digits + string.whitespace)
+STRIP_WS = str.maketrans('', '', string.whitespace)
+
+# Mapping for tones
+TONE_MARKS = {
+    'a': 'āáǎàa',
+    'e': 'ēéěèe',
+    'i': 'īíǐìi',
+    'o': 'ōóǒòo',
+    'u': 'ūúǔùu',
+    'v': 'ǖǘǚǜü',
+    'ü': 'ǖǘǚǜü',
+}
+
+def decode_syllable(base, tone):
+    # base is like "ni" or "nu:", tone is 1-5
     
-    words = s.split(' ')
-    new_words = []
+    # Handle u: -> ü
+    base = base.replace('u:', 'ü')
+    base = base.replace('U:', 'Ü')
+
+    if tone == 5:
+        return base
+        
+    # Find which vowel to mark
+    vowels = 'aeiouvü'
+    idx_to_mark = -1
     
-    for word in words:
-        if not word: 
-            continue
+    # Check for 'a' or 'e'
+    if 'a' in base:
+        idx_to_mark = base.find('a')
+    elif 'e' in base:
+        idx_to_mark = base.find('e')
+    elif 'ou' in base:
+        idx_to_mark = base.find('o')
+    else:
+        # Find last vowel
+        for i in range(len(base) - 1, -1, -1):
+            if base[i].lower() in vowels:
+                idx_to_mark = i
+                break
+                
+    if idx_to_mark != -1:
+        char = base[idx_to_mark]
+        lower_char = char.lower()
+        if lower_char in TONE_MARKS:
+            # tone 1 is index 0
+            replacement = TONE_MARKS[lower_char][tone-1]
+            if char.isupper():
+                replacement = replacement.upper()
             
-        # Detect tone number
-        if word[-1].isdigit():
-            try:
-                tone = int(word[-1])
-                base = word[:-1]
-            except ValueError:
-                tone = 5
-                base = word
-        else:
+            base = base[:idx_to_mark] + replacement + base[idx_to_mark+1:]
+    
+    return base
+
+@lru_cache(maxsize=None)
+def decode_pinyin_word(word):
+    # word is like "ni3" or "nu:4"
+    # CC-CEDICT only uses a few thousand distinct syllables, so this is memoized
+
+    # Detect tone number
+    if word[-1].isdigit():
+        try:
+            tone = int(word[-1])
+            base = word[:-1]
+        except ValueError:
             tone = 5
             base = word
-            
-        # Handle u: -> ü
-        base = base.replace('u:', 'ü')
-        base = base.replace('U:', 'Ü')
-        
-        if tone < 1 or tone > 5:
-             new_words.append(word)
-             continue
+    else:
+        tone = 5
+        base = word
+    
+    if tone < 1 or tone > 5:
+        return word
 
-        if tone == 5:
-            new_words.append(base)
-            continue
-            
-        # Find which vowel to mark
-        vowels = 'aeiouvü'
-        idx_to_mark = -1
-        
-        # Check for 'a' or 'e'
-        if 'a' in base:
-            idx_to_mark = base.find('a')
-        elif 'e' in base:
-            idx_to_mark = base.find('e')
-        elif 'ou' in base:
-            idx_to_mark = base.find('o')
-        else:
-            # Find last vowel
-            for i in range(len(base) - 1, -1, -1):
-                if base[i].lower() in vowels:
-                    idx_to_mark = i
-                    break
-                    
-        if idx_to_mark != -1:
-            char = base[idx_to_mark]
-            lower_char = char.lower()
-            if lower_char in tone_marks:
-                # tone 1 is index 0
-                replacement = tone_marks[lower_char][tone-1]
-                if char.isupper():
-                    replacement = replacement.upper()
-                
-                base = base[:idx_to_mark] + replacement + base[idx_to_mark+1:]
-        
-        new_words.append(base)
-        
-    return ' '.join(new_words)
+    return decode_syllable(base, tone)
+
+def decode_pinyin(s):
+    # s is like "ni3 hao3" or "nu:4"
+    return ' '.join(decode_pinyin_word(word) for word in s.split(' ') if word)
 
 def parse_line(line):
     # Format: Traditional Simplified [pin1 yin1] /glossary 1/glossary 2/
     # Regex to capture the parts
-    match = re.match(r'(\S+)\s+(\S+)\s+\[(.*?)\]\s+/(.*)/', line)
+    match = LINE_RE.match(line)
     if match:
         traditional = match.group(1)
         simplified = match.group(2)
@@ -89,11 +110,11 @@ def parse_line(line):
         definitions = match.group(4)
         
         # Create normalized pinyin: remove numbers and spaces
-        pinyin_clean = re.sub(r'[0-9\s]', '', pinyin).lower()
+        pinyin_clean = pinyin.translate(STRIP_DIGITS_WS).lower()
 
         # Create numbered pinyin: remove spaces, keep numbers
         # e.g. "ni3 hao3" -> "ni3hao3"
-        pinyin_numbered = re.sub(r'\s', '', pinyin).lower()
+        pinyin_numbered = pinyin.translate(STRIP_WS).lower()
         
         # Create marked pinyin
         pinyin_marks = decode_pinyin(pinyin)
@@ -101,11 +122,46 @@ def parse_line(line):
         return traditional, simplified, pinyin, pinyin_clean, pinyin_numbered, pinyin_marks, definitions
     return None
 
-def parse_tatoeba(cursor, filename='en_cn_sentence_pairs.tsv'):
-    """Parse Tatoeba sentence pairs and insert into database."""
-    print(f"Parsing Tatoeba sentences from {filename}...")
-    
-    sentences = []
+def parse_lines(lines):
+    """Parse a chunk of dictionary lines, adding each entry's has_stroke flag.
+
+    Runs in a worker process, so it only uses module-level state.
+    """
+    entries = []
+    for line in lines:
+        if line.startswith('#') or line.startswith('%'):
+            continue
+        
+        parts = parse_line(line.strip())
+        if parts:
+            # Check if has stroke data (at least one CJK character)
+            has_stroke = 1 if CJK_RE.search(parts[1]) else 0
+            entries.append(parts + (has_stroke,))
+    return entries
+
+def build_word_matcher(words):
+    """Return a function giving the set of the given words found in a sentence."""
+    # To be fast, we only check common word lengths (1-4)
+    words = [w for w in words if len(w) <= 4]
+
+    if ahocorasick is not None and words:
+        # Single pass over each sentence in C
+        automaton = ahocorasick.Automaton()
+        for w in words:
+            automaton.add_word(w, w)
+        automaton.make_automaton()
+        return lambda sentence: {w for _, w in automaton.iter(sentence)}
+
+    word_set = set(words)
+    def find_words(sentence):
+        # Check all substrings of length 1 to 4; the lookups run inside
+        # set.intersection rather than as Python-level membership tests
+        n = len(sentence)
+        return word_set.intersection(sentence[i:i+length] for length in range(1, 5) for i in range(n - length + 1))
+    return find_words
+
+def read_tatoeba(filename):
+    """Yield (chinese, english) Tatoeba sentence pairs without loading the whole file."""
     with open(filename, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
@@ -120,11 +176,13 @@ def parse_tatoeba(cursor, filename='en_cn_sentence_pairs.tsv'):
             chinese = parts[1]
             english = parts[3].rstrip('\r\n')  # Remove Windows line ending
             
-            sentences.append((chinese, english))
-    
-    print(f"Inserting {len(sentences)} sentences into database...")
-    cursor.executemany('INSERT INTO sentences (chinese, english) VALUES (?, ?)', sentences)
-    print("Done parsing Tatoeba sentences.")
+            yield chinese, english
+
+def parse_tatoeba(cursor, filename='en_cn_sentence_pairs.tsv'):
+    """Parse Tatoeba sentence pairs and insert into database."""
+    print(f"Parsing Tatoeba sentences from {filename}...")
+    cursor.executemany('INSERT INTO sentences (chinese, english) VALUES (?, ?)', read_tatoeba(filename))
+    print(f"Inserted {cursor.rowcount} sentences into database.")
 
 def main():
     db_path = 'resources/dictionary.db'
@@ -134,6 +192,10 @@ def main():
 
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
+    # The database is rebuilt from scratch, so skip durability work during the
+    # bulk load; all inserts go into a single transaction committed at the end
+    c.execute('PRAGMA synchronous = OFF')
+    c.execute('PRAGMA journal_mode = MEMORY')
     
     c.execute('DROP TABLE IF EXISTS dictionary')
     c.execute('''
@@ -151,14 +213,6 @@ def main():
             hsk_level INTEGER DEFAULT 0
         )
     ''')
-    
-    # We create indices for fast lookups
-    c.execute('CREATE INDEX idx_traditional ON dictionary(traditional)')
-    c.execute('CREATE INDEX idx_simplified ON dictionary(simplified)')
-    c.execute('CREATE INDEX idx_pinyin_clean ON dictionary(pinyin_clean)')
-    c.execute('CREATE INDEX idx_pinyin_numbered ON dictionary(pinyin_numbered)')
-    c.execute('CREATE INDEX idx_has_examples ON dictionary(has_examples)')
-    c.execute('CREATE INDEX idx_hsk_level ON dictionary(hsk_level)')
 
     print("Reading HSK word list...")
     hsk_map = {}
@@ -189,31 +243,27 @@ def main():
     
     try:
         with open(dict_path, 'r', encoding='utf-8') as f:
-            count = 0
-            for line in f:
-                if line.startswith('#') or line.startswith('%'):
-                    continue
-                
-                parts = parse_line(line.strip())
-                if parts:
-                    # parts: trad, simp, pinyin, clean, numbered, marks, defs
-                    # We add placeholder for has_examples(7), has_stroke(8), hsk_level(9)
+            lines = f.readlines()
+
+        # Parse chunks of lines in worker processes; imap keeps the file order
+        # so entry ids match a single-process run
+        chunks = [lines[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(lines), PARSE_CHUNK_SIZE)]
+        with Pool() as pool:
+            for parsed_chunk in pool.imap(parse_lines, chunks):
+                for parts in parsed_chunk:
+                    # parts: trad, simp, pinyin, clean, numbered, marks, defs, has_stroke
+                    # We add placeholder for has_examples(7) before has_stroke(8), and hsk_level(9)
                     entry_list = list(parts)
                     
-                    # Check if has stroke data (at least one CJK character)
-                    simplified = parts[1]
-                    has_stroke = 1 if any('\u4e00' <= char <= '\u9fff' for char in simplified) else 0
-                    
                     # Get HSK level
+                    simplified = parts[1]
                     hsk_level = hsk_map.get(simplified, 0)
                     
-                    entry_list.append(0) # has_examples placeholder
-                    entry_list.append(has_stroke)
+                    entry_list.insert(7, 0) # has_examples placeholder
                     entry_list.append(hsk_level)
                     
+                    word_to_id[simplified] = len(entries)
                     entries.append(entry_list)
-                    word_to_id[simplified] = count
-                    count += 1
 
         print(f"Loaded {len(entries)} dictionary entries.")
 
@@ -227,36 +277,46 @@ def main():
                 english TEXT
             )
         ''')
-        c.execute('CREATE INDEX idx_sentences_chinese ON sentences(chinese)')
-        
-        # Parse and insert Tatoeba data
-        print(f"Parsing Tatoeba sentences from {tato_filename}...")
-        tato_sentences_list = []
-        with open(tato_filename, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line: continue
-                parts = line.split('\t')
-                if len(parts) < 4: continue
-                tato_sentences_list.append((parts[1], parts[3].rstrip('\r\n')))
         
-        c.executemany('INSERT INTO sentences (chinese, english) VALUES (?, ?)', tato_sentences_list)
+        # Parse and insert Tatoeba data, then index it
+        parse_tatoeba(c, tato_filename)
+        c.execute('CREATE INDEX idx_sentences_chinese ON sentences(chinese)')
         
         # POPULATE has_examples
         print("Scoring dictionary entries based on example sentence availability...")
-        # To be fast, we only check common word lengths (1-4)
-        for chinese_sentence, _ in tato_sentences_list:
-            # Check all substrings of length 1 to 4
-            for i in range(len(chinese_sentence)):
-                for length in range(1, 5):
-                    if i + length > len(chinese_sentence): break
-                    sub = chinese_sentence[i:i+length]
-                    if sub in word_to_id:
-                        entries[word_to_id[sub]][7] = 1 # Set has_examples = 1
+        # Also record which words each sentence contains, so the web app can
+        # look up example sentences by word instead of scanning with LIKE
+        c.execute('DROP TABLE IF EXISTS sentence_words')
+        c.execute('''
+            CREATE TABLE sentence_words (
+                word TEXT,
+                sentence_id INTEGER,
+                PRIMARY KEY (word, sentence_id)
+            ) WITHOUT ROWID
+        ''')
+        find_words = build_word_matcher(word_to_id)
+
+        def scan_sentences():
+            # Stream sentences back from the database rather than keeping them in memory
+            for sentence_id, chinese_sentence in conn.execute('SELECT id, chinese FROM sentences'):
+                for word in find_words(chinese_sentence):
+                    entries[word_to_id[word]][7] = 1 # Set has_examples = 1
+                    yield word, sentence_id
+
+        c.executemany('INSERT INTO sentence_words (word, sentence_id) VALUES (?, ?)', scan_sentences())
 
         print("Inserting entries into database...")
         c.executemany('INSERT INTO dictionary (traditional, simplified, pinyin, pinyin_clean, pinyin_numbered, pinyin_marks, definitions, has_examples, has_stroke, hsk_level) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', entries)
 
+        # We create indices for fast lookups, after the bulk insert so each
+        # index is built in one sorted pass instead of updated per row
+        c.execute('CREATE INDEX idx_traditional ON dictionary(traditional)')
+        c.execute('CREATE INDEX idx_simplified ON dictionary(simplified)')
+        c.execute('CREATE INDEX idx_pinyin_clean ON dictionary(pinyin_clean)')
+        c.execute('CREATE INDEX idx_pinyin_numbered ON dictionary(pinyin_numbered)')
+        c.execute('CREATE INDEX idx_has_examples ON dictionary(has_examples)')
+        c.execute('CREATE INDEX idx_hsk_level ON dictionary(hsk_level)')
+
         print("Populating FTS index...")
         # Create FTS table for English definitions
         c.execute('DROP TABLE IF EXISTS dictionary_fts')
@@ -273,6 +333,9 @@ def main():
         ''')
         
         conn.commit()
+
+        # WAL lets the web app's readers run concurrently
+        c.execute('PRAGMA journal_mode = WAL')
         print("Done!")
         
     except FileNotFoundError: